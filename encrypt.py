@@ -67,6 +67,15 @@ from direncrypt.configuration import RunConfig
 from direncrypt.direncryption import DirEncryption
 
 
+def positive_int(value):
+    """Argument type for a positive integer."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+                'must be a positive integer: {}'.format(value))
+    return number
+
+
 def header():
     print("""direncrypt  Copyright (C) 2015  Domagoj Marsic
 This program comes with ABSOLUTELY NO WARRANTY.
@@ -102,6 +111,13 @@ if __name__ == '__main__':
     parser.add_argument('-H', '--gpg-homedir', help='GPG home directory')
     parser.add_argument('-k', '--gpg-keyring', help='GPG keyring file')
     parser.add_argument('-b', '--gpg-binary',  help='GPG binary file')
+    parser.add_argument('-j', '--jobs', type=positive_int,
+            help='Number of files to process, and directories to walk, '
+                 'in parallel (default: CPU count)')
+    parser.add_argument('--fast-scan',
+            action='store_true',
+            help='Skip registered files in directories unchanged since '
+                 'the last run; misses files edited in place')
 
     args = parser.parse_args()
 
@@ -71,11 +71,12 @@ class ConsistencyCheck(object):
             self.fileset[filename]['encrypted_file_check'] = \
                     os.path.exists(enc_full_path)
 
-    def clean_registry(self, filename):
-        """Clean entry from registry."""
-        print("Cleaning from registry: {}".format(filename))
+    def clean_registry(self, *filenames):
+        """Clean entries from registry in a single transaction."""
+        for filename in filenames:
+            print("Cleaning from registry: {}".format(filename))
         with Inventory(self.database) as inventory:
-            inventory.clean_record(filename)
+            inventory.clean_records(filenames)
         return True
 
     def loop_through(self, clean=False, resync=False):
@@ -87,6 +88,7 @@ class ConsistencyCheck(object):
         """
         count_nok = 0
         total_files = len(self.fileset)
+        to_clean = []
 
         print('Plaindir: %s' % self.parameters['plaindir'])
         print('Securedir: %s' % self.parameters['securedir'])
@@ -114,7 +116,7 @@ class ConsistencyCheck(object):
                     FileOps.delete_file(self.parameters['securedir'],
                                      entry['encrypted_file'])
 
-                self.clean_registry(entry['unencrypted_file'])
+                to_clean.append(entry['unencrypted_file'])
                 total_files -= 1
             elif not unenc_exists and resync:
                 de = DirEncryption(None, self.database)
@@ -131,5 +133,8 @@ class ConsistencyCheck(object):
                     self.fileset[filename]['unencrypted_file'],
                     self.fileset[filename]['encrypted_file']))
 
+        if to_clean:
+            self.clean_registry(*to_clean)
+
         print('\nTotal files in the register: %d' % total_files)
         print('Check: %d ok, %d not ok' % (total_files - count_nok, count_nok))
@@ -22,11 +22,17 @@
 
 import os
 import sys
-import uuid
+import time
+import queue
+import secrets
 import logging
+import itertools
+import threading
+import contextlib
+from concurrent.futures import (ThreadPoolExecutor, as_completed, wait,
+                                FIRST_COMPLETED)
 from direncrypt.gpgops import GPGOps
 from direncrypt.inventory import Inventory
-from direncrypt.fileops import FileOps
 from direncrypt.util import printit
 
 
@@ -50,8 +56,11 @@ class DirEncryption(object):
             self.database = database
 
         self.set_parameters(args)
+        self._name_prefix = secrets.token_hex(8)
+        self._name_counter = itertools.count()
         self.gpg = GPGOps(gpg_binary=self.gpg_binary,
                           gpg_recipient=self.public_id,
+                          gpg_homedir=self.gpg_homedir,
                           gpg_keyring=self.gpg_keyring)
 
     def set_parameters(self, args):
@@ -60,6 +69,14 @@ class DirEncryption(object):
         if args and args.verbose:
             self.verbose = True
 
+        self.fast_scan = False
+        if args and args.fast_scan:
+            self.fast_scan = True
+
+        self.jobs = os.cpu_count() or 1
+        if args and args.jobs is not None:
+            self.jobs = args.jobs
+
         with Inventory(self.database) as i:
             parameters = i.read_parameters()
         for parameter, value in parameters.items():
@@ -68,63 +85,152 @@ class DirEncryption(object):
 
 
         self.last_timestamp = parameters['last_timestamp']
+        # last_timestamp is not set before the first run
+        self.last_timestamp_i = int(self.last_timestamp or 0)
 
-        self.plaindir    = os.path.expanduser(parameters['plaindir'])
-        self.securedir   = os.path.expanduser(parameters['securedir'])
+        self.plaindir    = parameters['plaindir']
+        self.securedir   = parameters['securedir']
         self.public_id   = parameters['public_id']
         self.gpg_keyring = parameters['gpg_keyring']
-        self.gpg_homedir = os.path.expanduser(parameters['gpg_homedir'])
-        self.gpg_binary  = os.path.expanduser(parameters['gpg_binary'])
-
-        if args is None:
-            return
+        self.gpg_homedir = parameters['gpg_homedir']
+        self.gpg_binary  = parameters['gpg_binary']
 
-        if args.plaindir:
-            self.plaindir    = os.path.expanduser(args.plaindir)
-        if args.securedir:
-            self.securedir   = os.path.expanduser(args.securedir)
-        if args.public_id:
-            self.public_id   = args.public_id
-        if args.gpg_keyring:
-            self.gpg_keyring = args.gpg_keyring
-        if args.gpg_homedir:
-            self.gpg_homedir = os.path.expanduser(args.gpg_homedir)
-        if args.gpg_binary:
-            self.gpg_binary  = os.path.expanduser(args.gpg_binary)
+        if args is not None:
+            if args.plaindir:
+                self.plaindir    = args.plaindir
+            if args.securedir:
+                self.securedir   = args.securedir
+            if args.public_id:
+                self.public_id   = args.public_id
+            if args.gpg_keyring:
+                self.gpg_keyring = args.gpg_keyring
+            if args.gpg_homedir:
+                self.gpg_homedir = args.gpg_homedir
+            if args.gpg_binary:
+                self.gpg_binary  = args.gpg_binary
 
+        # expand only the paths that are actually used
+        self.plaindir    = os.path.expanduser(self.plaindir)
+        self.securedir   = os.path.expanduser(self.securedir)
+        self.gpg_homedir = os.path.expanduser(self.gpg_homedir)
+        self.gpg_binary  = os.path.expanduser(self.gpg_binary)
 
+        # length of plaindir including the trailing separator, used to
+        # get relative paths of walked files
+        self._plain_prefix_len = len(self.plaindir) + 1
 
     def encrypt_all(self):
         """Encrypt all new files from unencrypted directory.
 
         New files are those that have modified timestamp newer than
-        the timestamp of the last run. At the start of run, the timestamp
-        is updated.
+        the timestamp of the last run. The timestamp is set to the start
+        time of the run once the run has finished, unless fast_scan is
+        set. A registered file is skipped if its modified time, size and
+        inode are the same as when it was last encrypted.
 
-        The files are recursively searched for in the source directory.
+        The files are recursively searched for in the source directory
+        and handed to encryption as they are found. Up to self.jobs
+        files are encrypted in parallel, and at most twice as many are
+        in flight, so the walk waits for encryption to catch up. Finished
+        files are registered in batches from the calling thread, as the
+        database connection cannot be shared between threads. Files
+        encrypted before an error aborts the run are registered as well.
         """
-        register = {}
+        started = time.time()
+        max_pending = 2 * self.jobs
+        failed = 0
         with Inventory(self.database) as inv:
-            register = inv.read_register()
-            inv.update_last_timestamp()
-            files = self.find_unencrypted_files(register)
-            for plainfile, val in files.items():
-                if not val['is_new']:
-                    # remove old file in secure directory
-                    encfile = inv.read_line_from_register(plainfile)
-                    FileOps.delete_file(self.securedir, encfile)
-                encryptedfile = self.generate_name()
-                self.encrypt(plainfile, encryptedfile, inv)
-                if self.verbose:
-                    printit('Encrypted: {} ---> {}', plainfile, encryptedfile)
-
-    def encrypt(self, plainfile, encfile, inventory):
-        """Encrypt the file and register input and output filenames."""
+            register = inv.read_register_keys()
+            pending = {}
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                try:
+                    for plainfile, is_new, statinfo in \
+                            self.iter_unencrypted_files(register):
+                        if is_new:
+                            encryptedfile = self.generate_name()
+                        else:
+                            record = inv.read_record_from_register(plainfile)
+                            if (statinfo.st_mtime, statinfo.st_size,
+                                    statinfo.st_ino) == (record['modified_time'],
+                                                         record['size'],
+                                                         record['inode']):
+                                # same file as the one encrypted last time
+                                continue
+                            # replace the old file in secure directory
+                            encryptedfile = record['encrypted_file']
+                        future = executor.submit(self.encrypt,
+                                                 plainfile, encryptedfile,
+                                                 replace=not is_new)
+                        pending[future] = (plainfile, encryptedfile, statinfo)
+                        if len(pending) >= max_pending:
+                            finished, _ = wait(pending,
+                                               return_when=FIRST_COMPLETED)
+                            failed += self._register_encrypted(inv, pending,
+                                                               finished)
+                finally:
+                    finished, _ = wait(pending)
+                    failed += self._register_encrypted(inv, pending, finished)
+            if not self.fast_scan and not failed:
+                # files that failed, or that a fast scan may have skipped,
+                # must still look changed on the next run
+                inv.update_last_timestamp(started)
+
+    def _register_encrypted(self, inv, pending, finished):
+        """Register files from finished encryption futures.
+
+        The finished futures are removed from pending. Files that failed
+        with IOError are logged and skipped. Any other error is raised
+        once the successful files are registered.
+
+        Returns the number of files that failed.
+        """
+        encrypted = []
+        error = None
+        failed = 0
+        for future in finished:
+            plainfile, encryptedfile, statinfo = pending.pop(future)
+            e = future.exception()
+            if isinstance(e, IOError):
+                logging.warning('encrypt_all: {}'.format(e))
+                failed += 1
+                continue
+            if e is not None:
+                error = error or e
+                continue
+            encrypted.append((plainfile, encryptedfile, self.public_id,
+                              statinfo.st_mtime, statinfo.st_size,
+                              statinfo.st_ino))
+            if self.verbose:
+                printit('Encrypted: {} ---> {}', plainfile, encryptedfile)
+        inv.register_many(encrypted)
+        if error is not None:
+            raise error
+        return failed
+
+    def encrypt(self, plainfile, encfile, replace=False):
+        """Encrypt the file from plain directory into secure directory.
+
+        With replace set, an existing encrypted file is overwritten
+        atomically, so it is never left partially written. If encryption
+        fails, the partially written file is removed, as the secure
+        directory is synced as is.
+        """
         plain_path = os.path.join(self.plaindir, plainfile)
         encrypted_path = os.path.join(self.securedir, encfile)
+        output_path = encrypted_path + '.tmp' if replace else encrypted_path
 
-        self.gpg.encrypt(plain_path, encrypted_path)
-        inventory.register(plainfile, encfile, self.public_id)
+        if replace:
+            # left over from an interrupted run
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(output_path)
+        try:
+            self.gpg.encrypt(plain_path, output_path)
+        except Exception:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(output_path)
+            raise
+        if replace:
+            os.replace(output_path, encrypted_path)
 
 
     def decrypt_all(self, passphrase):
@@ -132,18 +238,24 @@ class DirEncryption(object):
 
         Files that are being decrypted must be registered under the same
         public id in the database, so the passed passphrase would work
-        for dectyption process.
+        for dectyption process. Up to self.jobs files are decrypted
+        in parallel.
         """
         register = {}
         with Inventory(self.database) as i:
             register = i.read_register()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = []
             for filename, record in register.items():
                 if record['public_id'] != self.public_id:
                     continue
+                futures.append(executor.submit(self.decrypt,
+                                               record['encrypted_file'],
+                                               record['unencrypted_file'],
+                                               passphrase))
+            for future in as_completed(futures):
                 try:
-                    self.decrypt(record['encrypted_file'],
-                             record['unencrypted_file'],
-                             passphrase)
+                    future.result()
                 except IOError as e:
                     logging.warning('decrypt_all: {}'.format(e))
 
@@ -155,45 +267,143 @@ class DirEncryption(object):
             printit('Decrypt: {} ---> {}', encrypted_path, plain_path)
         self.gpg.decrypt(encrypted_path, plain_path, phrase)
 
-    def find_unencrypted_files(self, register):
-        """List all files that need to be encrypted.
+    def iter_unencrypted_files(self, register):
+        """Yield all files that need to be encrypted.
 
-        os.walk does not expand tilde in paths, so the walk directory
-        is explicitly expanded.
+        The directory tree is walked with os.scandir, so file type and
+        stat information already returned by the directory listing is
+        reused instead of querying the filesystem again for each file.
+        Symbolic links to directories are not followed, same as os.walk.
 
-        register is the currently known list of encrypted files.
+        With more than one job, the subdirectories directly under
+        plaindir are walked in parallel by up to self.jobs threads, the
+        same number used for encryption, and files are yielded as soon
+        as any thread finds them. Walker threads wait while more than
+        twice that many files are found but not yet consumed.
 
-        Returns a dict, with relative path of the unencrypted files
-        for keys, and a dict with modified time key-value pair and
-        is_new boolean flag for values.
+        With fast_scan set, registered files in directories not modified
+        since the last run are skipped without a stat call. Adding,
+        removing or renaming files updates the directory modified time,
+        so new files are still found, but files edited in place in such
+        directories are missed until the next run without fast_scan.
+
+        register is the currently known set of encrypted files; any
+        container supporting membership tests will do.
+
+        Yields (relative_path, is_new, statinfo) tuples while walking,
+        so files can be processed before the whole tree has been listed.
+        In verbose mode only the yielded files are printed.
         """
-        files = {}
         if self.verbose:
             printit('Walking: {}', self.plaindir)
 
-        for (dirpath, dirnames, filenames) in os.walk(self.plaindir):
-            for name in filenames:
-                filepath = os.path.join(dirpath, name)
-                statinfo = os.stat(filepath)
-                mtime = statinfo.st_mtime
-                relative_path = filepath[(len(self.plaindir) + 1):]
-                if relative_path not in register:
-                    # new file
-                    enc_flag = '*'
-                    files[relative_path] = {'modified_time': mtime, 'is_new': True}
-                elif relative_path in register and mtime > int(self.last_timestamp):
-                    # file exists and has changed since last run
-                    enc_flag = '*'
-                    files[relative_path] = {'modified_time': mtime, 'is_new': False}
-                else:
-                    # file is not changed since last run
-                    enc_flag = ' '
-                if self.verbose:
-                    printit('List files: {} {} ({}): {}',
-                            enc_flag, int(mtime), self.last_timestamp,
-                            relative_path)
-        return files
+        if self.jobs <= 1:
+            for item in self._walk(self.plaindir, register):
+                yield item
+            return
+
+        subdirs = []
+        for item in self._walk(self.plaindir, register, subdirs):
+            yield item
+
+        # Walker threads pass files through the queue as they find them,
+        # each ending with a done marker. stop ends the walkers early if
+        # the caller stops consuming.
+        results = queue.Queue(maxsize=2 * self.jobs)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            # the queue is bounded, so wait for room unless stopped
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def walk_subtree(top):
+            try:
+                for item in self._walk(top, register, stop=stop):
+                    if not put(item):
+                        break
+            finally:
+                put(done)
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = [executor.submit(walk_subtree, d) for d in subdirs]
+            try:
+                remaining = len(futures)
+                while remaining:
+                    item = results.get()
+                    if item is done:
+                        remaining -= 1
+                    else:
+                        yield item
+            finally:
+                stop.set()
+            for future in futures:
+                # raise any error from the walker threads
+                future.result()
+
+    def _walk(self, top, register, subdirs=None, stop=None):
+        """Walk the tree under top, yielding files to be encrypted.
+
+        If subdirs is a list, directories found directly under top are
+        appended to it instead of being walked. If stop is an event,
+        the walk ends at the next directory once it is set.
+        """
+        verbose = self.verbose
+        fast_scan = self.fast_scan
+        last_ts = self.last_timestamp_i
+        prefix_len = self._plain_prefix_len
+        stack = [top]
+        while stack:
+            if stop is not None and stop.is_set():
+                return
+            dirpath = stack.pop()
+            try:
+                settled = fast_scan and os.stat(dirpath).st_mtime <= last_ts
+                it = os.scandir(dirpath)
+            except OSError:
+                # unreadable or vanished directory, skipped like os.walk
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if subdirs is None:
+                            stack.append(entry.path)
+                        else:
+                            subdirs.append(entry.path)
+                        continue
+                    if entry.is_dir():
+                        # symbolic link to a directory
+                        continue
+                    relative_path = entry.path[prefix_len:]
+                    is_new = relative_path not in register
+                    if settled and not is_new:
+                        # no entries added or renamed here since last run
+                        continue
+                    try:
+                        statinfo = entry.stat()
+                    except OSError:
+                        # vanished file or dangling symbolic link
+                        continue
+                    mtime = statinfo.st_mtime
+                    if not is_new and mtime <= last_ts:
+                        # file is not changed since last run
+                        continue
+                    if verbose:
+                        printit('List files: * {} ({}): {}',
+                                int(mtime), self.last_timestamp,
+                                relative_path)
+                    yield relative_path, is_new, statinfo
 
     def generate_name(self):
-        """Return a unique file name for encrypted file."""
-        return str(uuid.uuid4())
+        """Return a unique file name for encrypted file.
+
+        Names combine a random prefix, drawn once per instance, with
+        a counter, so no random bytes are read per file.
+        """
+        return '{}-{:08x}'.format(self._name_prefix, next(self._name_counter))
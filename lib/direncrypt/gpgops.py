@@ -47,15 +47,25 @@ class GPGOps(object):
                              verbose=verbose)
 
     def encrypt(self, plainfile, encfile):
-        """Encrypt content from plainfile into encfile."""
+        """Encrypt content from plainfile into encfile.
+
+        The file is streamed to GPG rather than read into memory.
+        IOError is raised if GPG fails to encrypt the file.
+        """
         with open(plainfile, mode = 'rb') as f:
-            self.gpg.encrypt(f.read(),
-                             self.recipient,
-                             armor=False,
-                             output=encfile)
+            result = self.gpg.encrypt_file(f,
+                                           self.recipient,
+                                           armor=False,
+                                           output=encfile)
+        if not result.ok:
+            raise IOError('GPG failed to encrypt {}: {}'.format(
+                plainfile, result.status))
 
     def decrypt(self, encfile, plainfile, phrase):
-        """Decrypt content from encfile into plainfile."""
+        """Decrypt content from encfile into plainfile.
+
+        The file is streamed to GPG rather than read into memory.
+        """
         if PYTHON_VERSION == 2 and \
                 not plainfile == plainfile.encode('ascii', errors='replace'):
             plainfile = plainfile.encode('ascii', errors='ignore')
@@ -63,8 +73,9 @@ class GPGOps(object):
                   'Decrypting to: {}'.format(plainfile))
         plaindir = os.path.dirname(plainfile)
         if not os.path.exists(plaindir):
-            os.makedirs(plaindir)
+            # another thread may create the same directory meanwhile
+            os.makedirs(plaindir, exist_ok=True)
         with open(encfile, mode='rb') as f:
-            self.gpg.decrypt(f.read(),
-                             passphrase=phrase,
-                             output=plainfile)
+            self.gpg.decrypt_file(f,
+                                  passphrase=phrase,
+                                  output=plainfile)
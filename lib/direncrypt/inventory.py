@@ -22,6 +22,20 @@
 
 import sqlite3
 
+# Shared by register() and register_many(). sqlite3 caches prepared
+# statements by their SQL text, so both reuse one prepared statement.
+_REGISTER_SQL = '''INSERT OR REPLACE INTO register
+    (unencrypted_file, encrypted_file, public_id,
+     modified_time, size, inode)
+    VALUES (?,?,?,?,?,?)'''
+
+# Register columns added after the original schema, with their types.
+_REGISTER_ADDED_COLUMNS = [
+    ('modified_time', 'REAL'),
+    ('size',          'INTEGER'),
+    ('inode',         'INTEGER')
+]
+
 class Inventory:
     """Inventory is a file/location register for encrypted files.
 
@@ -39,12 +53,25 @@ class Inventory:
         self.conn = sqlite3.connect(self.database)
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
+        self.upgrade_register()
         return self
 
     def __exit__(self, type, value, traceback):
         self.conn.commit()
         self.conn.close()
 
+    def upgrade_register(self):
+        """Add register columns missing in databases of older versions."""
+        columns = set(row[1] for row in
+                      self.conn.execute('PRAGMA table_info(register)'))
+        if not columns:
+            # no register table, nothing to upgrade
+            return
+        for name, type in _REGISTER_ADDED_COLUMNS:
+            if name not in columns:
+                self.conn.execute('ALTER TABLE register ADD COLUMN {} {}'
+                                  .format(name, type))
+
     def read_parameters(self, params_only=False):
         """Fetch program parameters and state from the database."""
         params = {}
@@ -72,34 +99,66 @@ class Inventory:
                 'public_id':        row[2]
             }
         return rows
-    
-    def read_line_from_register(self, plainfile):
-        """Get encrypted filename from unencrypted filename in register"""
-        result = {}
-        for row in self.cursor.execute('''
-                SELECT encrypted_file FROM register WHERE unencrypted_file = ? ''',(plainfile,)):
-            result[plainfile] = {'encrypted_file':   row[0]}
-        return result[plainfile]['encrypted_file']
-
-    def register(self, plain_path, enc_path, public_id):
-        """Register input and output filenames into a database."""
-        self.cursor.execute('''INSERT OR REPLACE INTO register
-            (unencrypted_file, encrypted_file, public_id)
-            VALUES (?,?,?)''',
-            (plain_path, enc_path, public_id))
-
-    def update_last_timestamp(self):
-        """Update last timestamp in the database."""
-        self.cursor.execute('''UPDATE state SET value = strftime('%s', 'now')
-            WHERE key = 'last_timestamp' ''')
+
+    def read_register_keys(self):
+        """Get a set of all registered unencrypted filenames."""
+        return set(row[0] for row in self.cursor.execute(
+                'SELECT unencrypted_file FROM register'))
+
+    def read_record_from_register(self, plainfile):
+        """Get encrypted filename and file stat from register.
+
+        Returns a dict with encrypted file, modified time, size and
+        inode recorded when the file was last encrypted.
+        """
+        row = self.cursor.execute('''
+                SELECT encrypted_file, modified_time, size, inode
+                FROM register WHERE unencrypted_file = ? ''',
+                (plainfile,)).fetchone()
+        return {
+            'encrypted_file': row[0],
+            'modified_time':  row[1],
+            'size':           row[2],
+            'inode':          row[3]
+        }
+
+    def register(self, plain_path, enc_path, public_id,
+                 modified_time=None, size=None, inode=None):
+        """Register input and output filenames into a database.
+
+        Modified time, size and inode of the unencrypted file are
+        stored to recognize unchanged files on later runs.
+        """
+        self.cursor.execute(_REGISTER_SQL,
+            (plain_path, enc_path, public_id, modified_time, size, inode))
+
+    def register_many(self, rows):
+        """Register a batch of rows.
+
+        Each row is a tuple of (plain_path, enc_path, public_id,
+        modified_time, size, inode).
+        """
+        self.cursor.executemany(_REGISTER_SQL, rows)
+
+    def update_last_timestamp(self, timestamp=None):
+        """Update last timestamp in the database.
+
+        The current time is used if timestamp is not given.
+        """
+        if timestamp is None:
+            self.cursor.execute('''UPDATE state SET value = strftime('%s', 'now')
+                WHERE key = 'last_timestamp' ''')
+        else:
+            self.cursor.execute('''UPDATE state SET value = ?
+                WHERE key = 'last_timestamp' ''', (int(timestamp),))
 
     def update_parameters(self, key, value):
         """Update program parameters."""
         self.cursor.execute('''UPDATE parameters
             SET value = ? WHERE key = ? ''', (value, key))
 
-    def clean_record(self, filename):
-        """Delete record based on the unencrypted filename."""
-        self.cursor.execute(
+    def clean_records(self, filenames):
+        """Delete records for a batch of unencrypted filenames."""
+        self.cursor.executemany(
                 '''DELETE FROM register WHERE unencrypted_file = ?''',
-                (filename,))
+                [(filename,) for filename in filenames])
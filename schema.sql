@@ -8,6 +8,9 @@ CREATE TABLE register (
     unencrypted_file    TEXT,
     encrypted_file      TEXT,
     public_id           TEXT,
+    modified_time       REAL,
+    size                INTEGER,
+    inode               INTEGER,
     timestamp           DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -81,11 +81,13 @@ def test_check(exists, expanduser, Inventory):
 
 @patch('direncrypt.consistency.Inventory')
 def test_clean_registry(Inventory):
-    """Test that clean_record is called with filename."""
+    """Test that clean_records is called with filenames."""
     c = ConsistencyCheck('test_database')
-    c.clean_registry('test_file')
+    c.clean_registry('test_file_1', 'test_file_2')
 
-    eq_(Inventory().__enter__().clean_record.call_args[0][0], 'test_file')
+    eq_(Inventory().__enter__().clean_records.call_count, 1)
+    eq_(Inventory().__enter__().clean_records.call_args[0][0],
+        ('test_file_1', 'test_file_2'))
 
 @patch('direncrypt.consistency.Inventory')
 @patch('direncrypt.consistency.DirEncryption')
@@ -114,7 +116,8 @@ def test_loop_through(delete_file, DirEncryption, Inventory):
 
     c.loop_through(clean=True)
     eq_(delete_file.call_count, 2)
-    eq_(c.clean_registry.call_count, 2)
+    eq_(c.clean_registry.call_count, 1)
+    eq_(len(c.clean_registry.call_args[0]), 2)
     eq_(DirEncryption.call_count, 0)
 
     delete_file.reset_mock()
@@ -26,6 +26,11 @@ sys.path.append(os.path.join(os.getcwd(), 'lib'))
 
 
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import nose
 from nose.tools import *
 from mock import MagicMock, patch
@@ -49,6 +54,14 @@ test_args.public_id = None
 test_args.gpg_keyring = None
 test_args.gpg_homedir = None
 test_args.gpg_binary = None
+test_args.jobs = 1
+test_args.fast_scan = None
+
+
+def registered_rows(inv):
+    """Return the rows passed to all register_many calls."""
+    return [row for call in inv.register_many.call_args_list
+            for row in call[0][0]]
 
 
 @patch('direncrypt.direncryption.GPGOps')
@@ -69,6 +82,7 @@ def test_set_parameters__from_param(expanduser, Inventory, GPGOps):
     de = DirEncryption(test_args)
     eq_(de.verbose, False)
     eq_(de.last_timestamp, saved_params['last_timestamp'])
+    eq_(de.last_timestamp_i, saved_params['last_timestamp'])
     eq_(de.plaindir, saved_params['plaindir'])
     eq_(de.securedir, saved_params['securedir'])
     eq_(de.public_id, saved_params['public_id'])
@@ -92,12 +106,10 @@ def test_set_parameters__from_args(expanduser, Inventory, GPGOps):
     args.gpg_keyring = 'runtime_gpg_keyring'
     args.gpg_homedir = 'runtime_gpg_homedir'
     args.gpg_binary = 'runtime_gpg_binary'
+    args.jobs = 4
+    args.fast_scan = True
 
     expanduser.side_effect = [
-        args.plaindir,
-        args.securedir,
-        args.gpg_homedir,
-        args.gpg_binary,
         args.plaindir,
         args.securedir,
         args.gpg_homedir,
@@ -105,6 +117,7 @@ def test_set_parameters__from_args(expanduser, Inventory, GPGOps):
     ]
 
     de = DirEncryption(args)
+    eq_(expanduser.call_count, 4)
     eq_(de.verbose, True)
     eq_(de.last_timestamp, saved_params['last_timestamp'])
     eq_(de.plaindir, args.plaindir)
@@ -113,11 +126,16 @@ def test_set_parameters__from_args(expanduser, Inventory, GPGOps):
     eq_(de.gpg_keyring, args.gpg_keyring)
     eq_(de.gpg_homedir, args.gpg_homedir)
     eq_(de.gpg_binary, args.gpg_binary)
+    eq_(de.jobs, 4)
+    eq_(de.fast_scan, True)
 
 
 @patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
 @patch('direncrypt.direncryption.os.path.expanduser')
-def test_encrypt(expanduser, GPGOps):
+def test_encrypt(expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
 
     expanduser.side_effect = [
         saved_params['plaindir'],
@@ -125,11 +143,9 @@ def test_encrypt(expanduser, GPGOps):
         saved_params['gpg_homedir'],
         saved_params['gpg_binary']
     ]
-    inventory = MagicMock()
 
     de = DirEncryption(test_args)
-    de.encrypt('plainfile', 'securefile', inventory)
-    eq_(inventory.register.call_count, 1)
+    de.encrypt('plainfile', 'securefile')
     de.gpg.encrypt.assert_called_once_with(
         os.path.join(saved_params['plaindir'], 'plainfile'),
         os.path.join(saved_params['securedir'], 'securefile')
@@ -139,7 +155,62 @@ def test_encrypt(expanduser, GPGOps):
 @patch('direncrypt.direncryption.GPGOps')
 @patch('direncrypt.direncryption.Inventory')
 @patch('direncrypt.direncryption.os.path.expanduser')
-@patch('direncrypt.direncryption.DirEncryption.find_unencrypted_files')
+@patch('direncrypt.direncryption.os.replace')
+def test_encrypt__replace(replace, expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    de = DirEncryption(test_args)
+    de.encrypt('plainfile', 'securefile', replace=True)
+
+    encrypted_path = os.path.join(saved_params['securedir'], 'securefile')
+    de.gpg.encrypt.assert_called_once_with(
+        os.path.join(saved_params['plaindir'], 'plainfile'),
+        encrypted_path + '.tmp'
+    )
+    replace.assert_called_once_with(encrypted_path + '.tmp', encrypted_path)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.remove')
+@patch('direncrypt.direncryption.os.replace')
+def test_encrypt__replace_failed(replace, remove, expanduser, Inventory,
+                                 GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    de = DirEncryption(test_args)
+    de.gpg.encrypt.side_effect = IOError('Boom!')
+    assert_raises(IOError, de.encrypt, 'plainfile', 'securefile',
+                  replace=True)
+
+    # the old encrypted file is kept, and no .tmp is left behind
+    encrypted_path = os.path.join(saved_params['securedir'], 'securefile')
+    eq_(replace.call_count, 0)
+    eq_(remove.call_count, 2)
+    remove.assert_called_with(encrypted_path + '.tmp')
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.DirEncryption.iter_unencrypted_files')
 @patch('direncrypt.direncryption.DirEncryption.encrypt')
 def test_encrypt_all__no_files(encrypt, find, expanduser, Inventory, GPGOps):
 
@@ -160,10 +231,9 @@ def test_encrypt_all__no_files(encrypt, find, expanduser, Inventory, GPGOps):
 @patch('direncrypt.direncryption.GPGOps')
 @patch('direncrypt.direncryption.Inventory')
 @patch('direncrypt.direncryption.os.path.expanduser')
-@patch('direncrypt.direncryption.DirEncryption.find_unencrypted_files')
+@patch('direncrypt.direncryption.DirEncryption.iter_unencrypted_files')
 @patch('direncrypt.direncryption.DirEncryption.encrypt')
-@patch('direncrypt.direncryption.FileOps.delete_file')
-def test_encrypt_all(delete_file, encrypt, find, expanduser, Inventory, GPGOps):
+def test_encrypt_all(encrypt, find, expanduser, Inventory, GPGOps):
 
     Inventory().__enter__().read_parameters.return_value = saved_params
 
@@ -174,21 +244,169 @@ def test_encrypt_all(delete_file, encrypt, find, expanduser, Inventory, GPGOps):
         saved_params['gpg_binary']
     ]
 
-    find.return_value = {
-        'test_path_1': {'modified_time': 1234, 'is_new': False},
-        'test_path_2': {'modified_time': 1337, 'is_new': False},
-        'test_path_3': {'modified_time': 1414, 'is_new': True}
-    }
+    find.return_value = iter([
+        ('test_path_1', False, MagicMock()),
+        ('test_path_2', False, MagicMock()),
+        ('test_path_3', True, MagicMock())
+    ])
+
+    Inventory().__enter__().read_record_from_register.side_effect = [
+        {'encrypted_file': 'uuid-1', 'modified_time': 1000,
+         'size': 1, 'inode': 1},
+        {'encrypted_file': 'uuid-2', 'modified_time': 1000,
+         'size': 2, 'inode': 2}
+    ]
 
     de = DirEncryption(test_args)
     de.encrypt_all()
 
     eq_(encrypt.call_count, 3)
-    eq_(encrypt.call_args_list[0][0][0], 'test_path_1')
-    eq_(encrypt.call_args_list[1][0][0], 'test_path_2')
+    eq_(encrypt.call_args_list[0][0], ('test_path_1', 'uuid-1'))
+    eq_(encrypt.call_args_list[0][1], {'replace': True})
+    eq_(encrypt.call_args_list[1][0], ('test_path_2', 'uuid-2'))
+    eq_(encrypt.call_args_list[1][1], {'replace': True})
     eq_(encrypt.call_args_list[2][0][0], 'test_path_3')
+    eq_(encrypt.call_args_list[2][1], {'replace': False})
     eq_(Inventory().__enter__().update_last_timestamp.call_count, 1)
-    eq_(delete_file.call_count, 2)
+    eq_(len(registered_rows(Inventory().__enter__())), 3)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.DirEncryption.iter_unencrypted_files')
+@patch('direncrypt.direncryption.DirEncryption.encrypt')
+def test_encrypt_all__unchanged(encrypt, find, expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    statinfo = MagicMock()
+    statinfo.st_mtime = 1400.5
+    statinfo.st_size = 42
+    statinfo.st_ino = 1001
+
+    Inventory().__enter__().read_record_from_register.return_value = {
+        'encrypted_file': 'uuid-1',
+        'modified_time': 1400.5,
+        'size': 42,
+        'inode': 1001
+    }
+
+    find.return_value = iter([('test_path_1', False, statinfo)])
+
+    de = DirEncryption(test_args)
+    de.encrypt_all()
+
+    eq_(encrypt.call_count, 0)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.DirEncryption.iter_unencrypted_files')
+@patch('direncrypt.direncryption.DirEncryption.encrypt')
+def test_encrypt_all__aborted(encrypt, find, expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    def walk(register):
+        yield 'test_path_1', True, MagicMock()
+        raise RuntimeError('Boom!')
+
+    find.side_effect = walk
+
+    de = DirEncryption(test_args)
+    assert_raises(RuntimeError, de.encrypt_all)
+
+    # the file encrypted before the error is registered,
+    # but the run does not count as done
+    eq_(encrypt.call_count, 1)
+    eq_(len(registered_rows(Inventory().__enter__())), 1)
+    eq_(Inventory().__enter__().update_last_timestamp.call_count, 0)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.DirEncryption.iter_unencrypted_files')
+@patch('direncrypt.direncryption.DirEncryption.encrypt')
+def test_encrypt_all__bounded(encrypt, find, expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    finished = []
+    finished_at_yield = []
+
+    def slow_encrypt(plainfile, encfile, replace):
+        time.sleep(0.01)
+        finished.append(plainfile)
+
+    def files():
+        for n in range(6):
+            finished_at_yield.append(len(finished))
+            yield ('test_path_{}'.format(n), True, MagicMock())
+
+    encrypt.side_effect = slow_encrypt
+    find.return_value = files()
+
+    de = DirEncryption(test_args)
+    de.encrypt_all()
+
+    # with one job, at most two files are waiting when the walk resumes
+    for n, count in enumerate(finished_at_yield):
+        ok_(count >= n - 1)
+    eq_(len(registered_rows(Inventory().__enter__())), 6)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.DirEncryption.iter_unencrypted_files')
+@patch('direncrypt.direncryption.DirEncryption.encrypt')
+def test_encrypt_all__file_failed(encrypt, find, expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    find.return_value = iter([
+        ('test_path_1', True, MagicMock()),
+        ('test_path_2', True, MagicMock())
+    ])
+    encrypt.side_effect = [None, IOError('Boom!')]
+
+    de = DirEncryption(test_args)
+    de.encrypt_all()
+
+    # the failed file must still look changed on the next run
+    eq_(len(registered_rows(Inventory().__enter__())), 1)
+    eq_(Inventory().__enter__().update_last_timestamp.call_count, 0)
 
 
 @patch('direncrypt.direncryption.GPGOps')
@@ -281,11 +499,39 @@ def test_decrypt_all(decrypt, expanduser, Inventory, GPGOps):
     eq_(de.decrypt.call_args_list[1][0], ('uuid-2', 'unenc_2', 'trustno1'))
 
 
+def scandir_listing(tree):
+    """Return a side effect for os.scandir serving the given tree.
+
+    tree maps directory paths to lists of (name, is_dir, mtime) tuples,
+    or to an exception raised when the directory is listed. An mtime
+    of None makes stat() of that entry fail.
+    """
+    def scandir(path):
+        if isinstance(tree[path], Exception):
+            raise tree[path]
+        entries = []
+        for name, is_dir, mtime in tree[path]:
+            entry = MagicMock()
+            entry.name = name
+            entry.path = os.path.join(path, name)
+            entry.is_dir.return_value = is_dir
+            if mtime is None:
+                entry.stat.side_effect = OSError('No such file or directory')
+            else:
+                entry.stat.return_value.st_mtime = mtime
+            entries.append(entry)
+        listing = MagicMock()
+        listing.__enter__.return_value = listing
+        listing.__iter__.return_value = iter(entries)
+        return listing
+    return scandir
+
+
 @patch('direncrypt.direncryption.GPGOps')
 @patch('direncrypt.direncryption.Inventory')
 @patch('direncrypt.direncryption.os.path.expanduser')
-@patch('direncrypt.direncryption.os.walk')
-def test_find_unencrypted_files__empty_dir(walk, expanduser, Inventory, GPGOps):
+@patch('direncrypt.direncryption.os.scandir')
+def test_iter_unencrypted_files__empty_dir(scandir, expanduser, Inventory, GPGOps):
 
     Inventory().__enter__().read_parameters.return_value = saved_params
 
@@ -304,10 +550,11 @@ def test_find_unencrypted_files__empty_dir(walk, expanduser, Inventory, GPGOps):
         }
     }
 
-    walk.return_value = []
+    scandir.side_effect = scandir_listing({saved_params['plaindir']: []})
 
     de = DirEncryption(test_args)
-    files = de.find_unencrypted_files(register)
+    files = {path: is_new for path, is_new, statinfo
+             in de.iter_unencrypted_files(register)}
 
     eq_(files, {})
 
@@ -315,9 +562,8 @@ def test_find_unencrypted_files__empty_dir(walk, expanduser, Inventory, GPGOps):
 @patch('direncrypt.direncryption.GPGOps')
 @patch('direncrypt.direncryption.Inventory')
 @patch('direncrypt.direncryption.os.path.expanduser')
-@patch('direncrypt.direncryption.os.walk')
-@patch('direncrypt.direncryption.os.stat')
-def test_find_unencrypted_files(stat, walk, expanduser, Inventory, GPGOps):
+@patch('direncrypt.direncryption.os.scandir')
+def test_iter_unencrypted_files(scandir, expanduser, Inventory, GPGOps):
 
     Inventory().__enter__().read_parameters.return_value = saved_params
 
@@ -336,16 +582,397 @@ def test_find_unencrypted_files(stat, walk, expanduser, Inventory, GPGOps):
         }
     }
 
-    walk.return_value = [
-        (saved_params['plaindir'], ['subdir_1'], ['unenc_1', 'unenc_2']),
-        (os.path.join(saved_params['plaindir'], 'subdir_1'), [], ['unenc_3'])
-    ]
-
-    stat.return_value.st_mtime = 1400
+    scandir.side_effect = scandir_listing({
+        saved_params['plaindir']: [
+            ('subdir_1', True, 1400),
+            ('unenc_1', False, 1400),
+            ('unenc_2', False, 1400)
+        ],
+        os.path.join(saved_params['plaindir'], 'subdir_1'): [
+            ('unenc_3', False, 1400)
+        ]
+    })
 
     de = DirEncryption(test_args)
-    files = de.find_unencrypted_files(register)
+    files = {path: is_new for path, is_new, statinfo
+             in de.iter_unencrypted_files(register)}
 
     eq_(len(files), 2)
     ok_('unenc_2' in files.keys())
     ok_(os.path.join('subdir_1', 'unenc_3') in files.keys())
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.scandir')
+def test_iter_unencrypted_files__changed(scandir, expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    register = set(['unenc_1', 'unenc_2'])
+
+    scandir.side_effect = scandir_listing({
+        saved_params['plaindir']: [
+            ('unenc_1', False, 1400),
+            ('unenc_2', False, saved_params['last_timestamp'] + 1)
+        ]
+    })
+
+    de = DirEncryption(test_args)
+    files = {path: is_new for path, is_new, statinfo
+             in de.iter_unencrypted_files(register)}
+
+    eq_(len(files), 1)
+    eq_(files['unenc_2'], False)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+def test_generate_name(expanduser, Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    de = DirEncryption(test_args)
+    names = [de.generate_name() for i in range(3)]
+
+    eq_(len(set(names)), 3)
+    eq_(len(set(name.split('-')[0] for name in names)), 1)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.scandir')
+@patch('direncrypt.direncryption.printit')
+def test_iter_unencrypted_files__verbose(printit, scandir, expanduser,
+                                         Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    scandir.side_effect = scandir_listing({
+        saved_params['plaindir']: [
+            ('unenc_1', False, 1400),
+            ('unenc_2', False, 1400)
+        ]
+    })
+
+    args = MagicMock()
+    args.verbose = True
+    args.plaindir = None
+    args.securedir = None
+    args.public_id = None
+    args.gpg_keyring = None
+    args.gpg_homedir = None
+    args.gpg_binary = None
+    args.jobs = 1
+    args.fast_scan = None
+
+    de = DirEncryption(args)
+    files = list(de.iter_unencrypted_files(set(['unenc_1'])))
+
+    listed = [c for c in printit.call_args_list
+              if c[0][0].startswith('List files')]
+    eq_(len(files), 1)
+    eq_(len(listed), 1)
+    eq_(listed[0][0][-1], 'unenc_2')
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.scandir')
+def test_iter_unencrypted_files__parallel(scandir, expanduser,
+                                          Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    subdir_1 = os.path.join(saved_params['plaindir'], 'subdir_1')
+    subdir_2 = os.path.join(saved_params['plaindir'], 'subdir_2')
+    scandir.side_effect = scandir_listing({
+        saved_params['plaindir']: [
+            ('subdir_1', True, 1400),
+            ('subdir_2', True, 1400),
+            ('unenc_1', False, 1400)
+        ],
+        subdir_1: [
+            ('nested', True, 1400),
+            ('unenc_2', False, 1400)
+        ],
+        os.path.join(subdir_1, 'nested'): [
+            ('unenc_3', False, 1400)
+        ],
+        subdir_2: [
+            ('unenc_4', False, 1400)
+        ]
+    })
+
+    de = DirEncryption(test_args)
+    de.jobs = 2
+    files = sorted(path for path, is_new, statinfo
+                   in de.iter_unencrypted_files(set()))
+
+    eq_(files, sorted([
+        os.path.join('subdir_1', 'nested', 'unenc_3'),
+        os.path.join('subdir_1', 'unenc_2'),
+        os.path.join('subdir_2', 'unenc_4'),
+        'unenc_1'
+    ]))
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.scandir')
+@patch('direncrypt.direncryption.os.stat')
+def test_iter_unencrypted_files__fast_scan(stat, scandir, expanduser,
+                                           Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    subdir_1 = os.path.join(saved_params['plaindir'], 'subdir_1')
+    dir_mtimes = {
+        saved_params['plaindir']: saved_params['last_timestamp'] - 1,
+        subdir_1: saved_params['last_timestamp'] + 1
+    }
+    stat.side_effect = lambda path: MagicMock(st_mtime=dir_mtimes[path])
+
+    changed = saved_params['last_timestamp'] + 1
+    scandir.side_effect = scandir_listing({
+        saved_params['plaindir']: [
+            ('subdir_1', True, 1400),
+            ('unenc_1', False, changed),
+            ('unenc_2', False, 1400)
+        ],
+        subdir_1: [
+            ('unenc_3', False, changed)
+        ]
+    })
+
+    register = set(['unenc_1', os.path.join('subdir_1', 'unenc_3')])
+
+    de = DirEncryption(test_args)
+    de.fast_scan = True
+    files = sorted(path for path, is_new, statinfo
+                   in de.iter_unencrypted_files(register))
+
+    # unenc_1 is registered in an unchanged directory and is not listed
+    eq_(files, sorted(['unenc_2', os.path.join('subdir_1', 'unenc_3')]))
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.scandir')
+def test_iter_unencrypted_files__unreadable(scandir, expanduser,
+                                            Inventory, GPGOps):
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    scandir.side_effect = scandir_listing({
+        saved_params['plaindir']: [
+            ('locked', True, 1400),
+            ('dangling', False, None),
+            ('unenc_1', False, 1400)
+        ],
+        os.path.join(saved_params['plaindir'], 'locked'):
+            PermissionError('Permission denied')
+    })
+
+    de = DirEncryption(test_args)
+    files = [path for path, is_new, statinfo
+             in de.iter_unencrypted_files(set())]
+
+    eq_(files, ['unenc_1'])
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.scandir')
+def test_iter_unencrypted_files__parallel_streams(scandir, expanduser,
+                                                  Inventory, GPGOps):
+    """Files from a subtree are yielded before its walk has finished."""
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    subdir_1 = os.path.join(saved_params['plaindir'], 'subdir_1')
+    nested = os.path.join(subdir_1, 'nested')
+    listing = scandir_listing({
+        saved_params['plaindir']: [
+            ('subdir_1', True, 1400)
+        ],
+        subdir_1: [
+            ('nested', True, 1400),
+            ('unenc_1', False, 1400)
+        ],
+        nested: [
+            ('unenc_2', False, 1400)
+        ]
+    })
+
+    released = threading.Event()
+    def scandir_blocking(path):
+        if path == nested and not released.wait(5):
+            raise RuntimeError('subtree was not streamed')
+        return listing(path)
+    scandir.side_effect = scandir_blocking
+
+    de = DirEncryption(test_args)
+    de.jobs = 2
+    files = de.iter_unencrypted_files(set())
+
+    eq_(next(files)[0], os.path.join('subdir_1', 'unenc_1'))
+    released.set()
+    eq_([f[0] for f in files], [os.path.join('subdir_1', 'nested', 'unenc_2')])
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.Inventory')
+@patch('direncrypt.direncryption.os.path.expanduser')
+@patch('direncrypt.direncryption.os.scandir')
+def test_walk__stopped(scandir, expanduser, Inventory, GPGOps):
+    """A stopped walk lists no further directories."""
+
+    Inventory().__enter__().read_parameters.return_value = saved_params
+
+    expanduser.side_effect = [
+        saved_params['plaindir'],
+        saved_params['securedir'],
+        saved_params['gpg_homedir'],
+        saved_params['gpg_binary']
+    ]
+
+    subdir_1 = os.path.join(saved_params['plaindir'], 'subdir_1')
+    listing = scandir_listing({
+        saved_params['plaindir']: [
+            ('subdir_1', True, 1400)
+        ],
+        subdir_1: [
+            ('unenc_1', False, 1400)
+        ]
+    })
+
+    stop = threading.Event()
+    def scandir_stopping(path):
+        stop.set()
+        return listing(path)
+    scandir.side_effect = scandir_stopping
+
+    de = DirEncryption(test_args)
+    files = list(de._walk(saved_params['plaindir'], set(), stop=stop))
+
+    eq_(files, [])
+    eq_(scandir.call_count, 1)
+
+
+@patch('direncrypt.direncryption.GPGOps')
+@patch('direncrypt.direncryption.time.time')
+def test_encrypt_all__fast_scan_then_full(now, GPGOps):
+    """An in-place edit skipped by a fast scan is found by a full run."""
+
+    tmp = tempfile.mkdtemp()
+    try:
+        plaindir = os.path.join(tmp, 'plain')
+        securedir = os.path.join(tmp, 'secure')
+        subdir = os.path.join(plaindir, 'sub')
+        plainfile = os.path.join(subdir, 'a')
+        os.makedirs(subdir)
+        os.makedirs(securedir)
+        with open(plainfile, 'w') as f:
+            f.write('v1')
+
+        database = os.path.join(tmp, 'inventory.sqlite')
+        conn = sqlite3.connect(database)
+        with open('schema.sql') as f:
+            conn.executescript(f.read())
+        conn.close()
+
+        args = MagicMock()
+        args.verbose = None
+        args.plaindir = plaindir
+        args.securedir = securedir
+        args.public_id = 'public_id'
+        args.gpg_keyring = None
+        args.gpg_homedir = None
+        args.gpg_binary = None
+        args.jobs = 1
+
+        def run(fast_scan, started):
+            args.fast_scan = fast_scan
+            now.return_value = started
+            de = DirEncryption(args, database=database)
+            de.gpg.encrypt.side_effect = shutil.copyfile
+            de.encrypt_all()
+
+        def encrypted_content():
+            name = os.listdir(securedir)[0]
+            with open(os.path.join(securedir, name)) as f:
+                return f.read()
+
+        run(False, 1000)
+
+        # edit in place after the first run, directories look unchanged
+        with open(plainfile, 'w') as f:
+            f.write('v2')
+        os.utime(plainfile, (1500, 1500))
+        os.utime(subdir, (900, 900))
+        os.utime(plaindir, (900, 900))
+
+        run(True, 2000)
+        eq_(encrypted_content(), 'v1')
+
+        run(False, 3000)
+        eq_(encrypted_content(), 'v2')
+    finally:
+        shutil.rmtree(tmp)
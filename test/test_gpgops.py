@@ -40,7 +40,18 @@ def test_encrypt(gpg):
     encryptedfile = 'encryptedfile'
     g.encrypt(plainfile, encryptedfile)
 
-    eq_(g.gpg.encrypt.call_count, 1)
+    eq_(g.gpg.encrypt_file.call_count, 1)
+
+
+@patch('direncrypt.gpgops.gnupg.GPG')
+def test_encrypt__failed(gpg):
+    g = GPGOps(gpg_recipient='B183CAFE')
+    g.gpg.encrypt_file.return_value.ok = False
+
+    fsrc = tempfile.NamedTemporaryFile()
+    plainfile = fsrc.name
+    encryptedfile = 'encryptedfile'
+    assert_raises(IOError, g.encrypt, plainfile, encryptedfile)
 
 
 @patch('direncrypt.gpgops.os')
@@ -54,4 +65,4 @@ def test_decrypt(os, gpg):
     phrase = 'trustno1'
     g.decrypt(encryptedfile, plainfile, phrase)
 
-    eq_(g.gpg.decrypt.call_count, 1)
+    eq_(g.gpg.decrypt_file.call_count, 1)
@@ -35,6 +35,26 @@ def test_inventory_enter(sqlite3):
     with Inventory('test_database') as i:
         ok_(i.cursor)
 
+@patch('direncrypt.inventory.sqlite3.connect')
+def test_inventory_enter__upgrade(connect):
+
+    connect().execute.return_value = [
+        (0, 'id', 'INTEGER', 0, None, 1),
+        (1, 'unencrypted_file', 'TEXT', 0, None, 0),
+        (2, 'encrypted_file', 'TEXT', 0, None, 0),
+        (3, 'public_id', 'TEXT', 0, None, 0),
+        (4, 'timestamp', 'DATETIME', 0, None, 0)
+    ]
+
+    with Inventory('test_database') as inv:
+        statements = [c[0][0] for c in connect().execute.call_args_list]
+
+    eq_(statements[1:], [
+        'ALTER TABLE register ADD COLUMN modified_time REAL',
+        'ALTER TABLE register ADD COLUMN size INTEGER',
+        'ALTER TABLE register ADD COLUMN inode INTEGER'
+    ])
+
 @patch('direncrypt.inventory.sqlite3.connect')
 def test_read_parameters(connect):
 
@@ -76,6 +96,35 @@ def test_read_register(connect):
     eq_(rows['unenc_2']['public_id'], 'public_id_2')
 
 
+@patch('direncrypt.inventory.sqlite3.connect')
+def test_read_register_keys(connect):
+
+    connect().cursor().execute.return_value = [
+        ('unenc_1',),
+        ('unenc_2',)
+    ]
+
+    with Inventory('test_database') as inv:
+        keys = inv.read_register_keys()
+
+    eq_(keys, set(['unenc_1', 'unenc_2']))
+
+
+@patch('direncrypt.inventory.sqlite3.connect')
+def test_read_record_from_register(connect):
+
+    connect().cursor().execute().fetchone.return_value = \
+        ('uuid-1', 1400.5, 42, 1001)
+
+    with Inventory('test_database') as inv:
+        record = inv.read_record_from_register('unenc_1')
+
+    eq_(record['encrypted_file'], 'uuid-1')
+    eq_(record['modified_time'], 1400.5)
+    eq_(record['size'], 42)
+    eq_(record['inode'], 1001)
+
+
 @patch('direncrypt.inventory.sqlite3.connect')
 def test_register(connect):
 
@@ -84,7 +133,30 @@ def test_register(connect):
 
         eq_(inv.cursor.execute.call_count, 1)
         eq_(inv.cursor.execute.call_args[0][1],
-            ('plain', 'encrypted', 'public_id'))
+            ('plain', 'encrypted', 'public_id', None, None, None))
+
+@patch('direncrypt.inventory.sqlite3.connect')
+def test_register_many(connect):
+
+    rows = [
+        ('plain_1', 'encrypted_1', 'public_id', 1400.5, 42, 1001),
+        ('plain_2', 'encrypted_2', 'public_id', 1500.5, 43, 1002)
+    ]
+
+    with Inventory('test_database') as inv:
+        inv.register_many(rows)
+
+        eq_(inv.cursor.executemany.call_count, 1)
+        eq_(inv.cursor.executemany.call_args[0][1], rows)
+
+@patch('direncrypt.inventory.sqlite3.connect')
+def test_update_last_timestamp(connect):
+
+    with Inventory('test_database') as inv:
+        inv.update_last_timestamp(1234567890.5)
+
+        eq_(inv.cursor.execute.call_count, 1)
+        eq_(inv.cursor.execute.call_args[0][1], (1234567890,))
 
 @patch('direncrypt.inventory.sqlite3.connect')
 def test_update_parameters(connect):
@@ -94,3 +166,14 @@ def test_update_parameters(connect):
 
         eq_(inv.cursor.execute.call_count, 1)
         eq_(inv.cursor.execute.call_args[0][1], ('value_1', 'key_1'))
+
+
+@patch('direncrypt.inventory.sqlite3.connect')
+def test_clean_records(connect):
+
+    with Inventory('test_database') as inv:
+        inv.clean_records(['plain_1', 'plain_2'])
+
+        eq_(inv.cursor.executemany.call_count, 1)
+        eq_(inv.cursor.executemany.call_args[0][1],
+            [('plain_1',), ('plain_2',)])